@@ -31,6 +31,8 @@ influxdb_client = InfluxDBClient(
     url=url, token=token, org=influx_org, retries=retries, timeout=3000
 )
 
+API_USAGE_BULK_QUERY_CHUNK_SIZE = 500
+
 DEFAULT_DROP_COLUMNS = (
     "organisation",
     "organisation_id",
@@ -347,41 +349,49 @@ def get_top_organisations(date_start: str, limit: str = ""):
     return dataset
 
 
-def get_current_api_usage(organisation_id: int, date_start: str) -> int:
+def get_current_api_usage_bulk(
+    organisation_ids: typing.Iterable[int], date_start: str
+) -> dict[int, int]:
     """
-    Query influx db for api usage
+    Query influx db for api usage of many organisations at once
+
+    The organisations are queried in chunks to keep the size of
+    each query bounded.
 
-    :param organisation_id: filtered organisation
-    :param date_range: data range for current api usage window
+    :param organisation_ids: filtered organisations
+    :param date_start: start of the current api usage window
 
-    :return: number of current api calls
+    :return: number of current api calls keyed by organisation id
     """
+    organisation_ids = [str(organisation_id) for organisation_id in organisation_ids]
 
-    bucket = read_bucket
-    results = InfluxDBWrapper.influx_query_manager(
-        date_start=date_start,
-        bucket=bucket,
-        filters=build_filter_string(
-            [
-                'r._measurement == "api_call"',
-                'r["_field"] == "request_count"',
-                f'r["organisation_id"] == "{organisation_id}"',
-            ]
-        ),
-        drop_columns=("_start", "_stop", "_time"),
-        extra='|> sum() \
-               |> group() \
-               |> sort(columns: ["_value"], desc: true) ',
-    )
+    dataset = defaultdict(int)
+    for chunk_start in range(0, len(organisation_ids), API_USAGE_BULK_QUERY_CHUNK_SIZE):
+        chunk_end = chunk_start + API_USAGE_BULK_QUERY_CHUNK_SIZE
+        organisation_ids_input = str(organisation_ids[chunk_start:chunk_end]).replace(
+            "'", '"'
+        )
 
-    for result in results:
-        # Return zero if there are no API calls recorded.
-        if len(result.records) == 0:
-            return 0
+        results = InfluxDBWrapper.influx_query_manager(
+            date_start=date_start,
+            bucket=read_bucket,
+            filters=build_filter_string(
+                [
+                    'r._measurement == "api_call"',
+                    'r["_field"] == "request_count"',
+                    f'contains(value: r["organisation_id"], set: {organisation_ids_input})',
+                ]
+            ),
+            drop_columns=("_start", "_stop", "_time"),
+            extra='|> group(columns: ["organisation_id"]) \
+                   |> sum()',
+        )
 
-        return sum(r.get_value() for r in result.records)
+        for result in results:
+            for record in result.records:
+                dataset[int(record.values["organisation_id"])] += record.get_value()
 
-    return 0
+    return dict(dataset)
 
 
 def build_filter_string(filter_expressions: typing.List[str]) -> str:
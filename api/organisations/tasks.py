@@ -1,14 +1,21 @@
 import logging
 import math
-from datetime import timedelta
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
 
-from app_analytics.influxdb_wrapper import get_current_api_usage
+from app_analytics.influxdb_wrapper import get_current_api_usage_bulk
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.core.mail import send_mail
-from django.db.models import F, Max
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import F, Sum
+from django.template.backends.django import Template
+from django.template.loader import get_template
 from django.utils import timezone
+from flagsmith import Flagsmith
+from flagsmith.models import Flags
 from task_processor.decorators import (
     register_recurring_task,
     register_task_handler,
@@ -27,6 +34,7 @@ from organisations.models import (
     OrganisationAPIUsageNotification,
     OrganisationRole,
     Subscription,
+    UserOrganisation,
 )
 from organisations.subscriptions.constants import FREE_PLAN_ID
 from organisations.subscriptions.subscription_service import (
@@ -50,6 +58,36 @@ from .subscriptions.constants import (
 
 logger = logging.getLogger(__name__)
 
+_SORTED_API_USAGE_ALERT_THRESHOLDS = sorted(API_USAGE_ALERT_THRESHOLDS)
+
+
+def _get_local_flagsmith_client() -> Flagsmith:
+    """
+    Get the locally evaluating client shared by the API usage tasks.
+
+    The client is created once per process and reused by every task
+    run, since get_client caches clients by name.
+    """
+    return get_client("local", local_eval=True)
+
+
+def _get_organisation_flags(
+    flagsmith_client: Flagsmith, organisation: Organisation
+) -> Flags:
+    """
+    Evaluate the flags for an organisation's identity.
+
+    The results aren't cached across organisations since the identity
+    and its organisation_id trait are unique to each organisation.
+    """
+    return flagsmith_client.get_identity_flags(
+        organisation.flagsmith_identifier,
+        traits={
+            "organisation_id": organisation.id,
+            "subscription.plan": organisation.subscription.plan,
+        },
+    )
+
 
 @register_task_handler()
 def send_org_over_limit_alert(organisation_id: int) -> None:
@@ -100,33 +138,31 @@ def finish_subscription_cancellation() -> None:
     for subscription in Subscription.objects.filter(
         cancellation_date__lt=now,
         cancellation_date__gt=previously,
-    ):
+    ).select_related("organisation__subscription_information_cache"):
         subscription.organisation.cancel_users()
         subscription.save_as_free_subscription()
 
 
-def send_api_usage_notification(
-    organisation: Organisation, matched_threshold: int
-) -> None:
+@lru_cache
+def _get_api_usage_notification_template(template_name: str) -> Template:
     """
-    Send notification to users that the API has breached a threshold.
-
-    Only admins are included if the matched threshold is under
-    100% of the API usage limits.
+    Load the API usage notification templates once per process,
+    rather than resolving them on every notification sent.
     """
+    return get_template(template_name)
+
 
-    recipient_list = FFAdminUser.objects.filter(
-        userorganisation__organisation=organisation,
+@register_task_handler()
+def send_api_usage_notification_email(
+    organisation_id: int, matched_threshold: int, recipient_list: list[str]
+) -> None:
+    organisation = Organisation.objects.select_related("subscription").get(
+        id=organisation_id
     )
 
     if matched_threshold < 100:
         message = "organisations/api_usage_notification.txt"
         html_message = "organisations/api_usage_notification.html"
-
-        # Since threshold < 100 only include admins.
-        recipient_list = recipient_list.filter(
-            userorganisation__role=OrganisationRole.ADMIN,
-        )
     else:
         message = "organisations/api_usage_notification_limit.txt"
         html_message = "organisations/api_usage_notification_limit.html"
@@ -138,23 +174,47 @@ def send_api_usage_notification(
 
     send_mail(
         subject=f"Flagsmith API use has reached {matched_threshold}%",
-        message=render_to_string(message, context),
+        message=_get_api_usage_notification_template(message).render(context),
         from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=list(recipient_list.values_list("email", flat=True)),
-        html_message=render_to_string(html_message, context),
+        recipient_list=recipient_list,
+        html_message=_get_api_usage_notification_template(html_message).render(context),
         fail_silently=True,
     )
 
-    OrganisationAPIUsageNotification.objects.create(
-        organisation=organisation,
-        percent_usage=matched_threshold,
-        notified_at=timezone.now(),
+
+def _get_api_usage_notification_recipients(
+    matched_thresholds: dict[int, int]
+) -> dict[int, list[str]]:
+    """
+    Get the emails to notify for each organisation in a single query,
+    given the threshold matched by each organisation.
+
+    Only admins are included if the matched threshold is under
+    100% of the API usage limits.
+    """
+    user_organisations = (
+        UserOrganisation.objects.filter(organisation_id__in=list(matched_thresholds))
+        .order_by("user_id")
+        .values_list("organisation_id", "role", "user__email")
     )
 
+    recipients = defaultdict(list)
+    for organisation_id, role, email in user_organisations:
+        # Since threshold < 100 only include admins.
+        if matched_thresholds[organisation_id] < 100 and role != OrganisationRole.ADMIN:
+            continue
+        recipients[organisation_id].append(email)
+
+    return recipients
 
-def _handle_api_usage_notifications(organisation: Organisation) -> None:
-    now = timezone.now()
 
+def _get_api_usage_period(
+    organisation: Organisation, now: datetime
+) -> tuple[datetime, int, int] | None:
+    """
+    Get the start of the current API usage period for an organisation,
+    the number of days since then and the allowed API calls.
+    """
     if organisation.subscription.is_free_plan:
         allowed_api_calls = organisation.subscription.max_api_calls
         # Default to a rolling month for free accounts
@@ -166,66 +226,157 @@ def _handle_api_usage_notifications(organisation: Organisation) -> None:
         logger.error(
             f"Paid organisation {organisation.id} is missing subscription information cache"
         )
-        return
+        return None
     else:
         subscription_cache = organisation.subscription_information_cache
         billing_starts_at = subscription_cache.current_billing_term_starts_at
 
         # Truncate to the closest active month to get start of current period.
-        month_delta = relativedelta(now, billing_starts_at).months
+        month_delta = (now.year - billing_starts_at.year) * 12 + (
+            now.month - billing_starts_at.month
+        )
         period_starts_at = relativedelta(months=month_delta) + billing_starts_at
+        if period_starts_at > now:
+            # The billing day of the current month hasn't been reached yet.
+            period_starts_at = relativedelta(months=month_delta - 1) + billing_starts_at
 
-        days = relativedelta(now, period_starts_at).days
+        days = (now - period_starts_at).days
         allowed_api_calls = subscription_cache.allowed_30d_api_calls
 
-    api_usage = get_current_api_usage(organisation.id, f"-{days}d")
+    return period_starts_at, days, allowed_api_calls
 
-    api_usage_percent = int(100 * api_usage / allowed_api_calls)
 
-    matched_threshold = None
-    for threshold in API_USAGE_ALERT_THRESHOLDS:
-        if threshold > api_usage_percent:
-            break
+def _get_matched_threshold(
+    period_starts_at: datetime,
+    allowed_api_calls: int,
+    api_usage: int,
+    previous_notifications: list[tuple[datetime, int]],
+) -> int | None:
+    """
+    Get the highest threshold reached by the API usage, unless
+    it has already been notified for the current period.
+    """
+    # Most organisations are well below the thresholds, so bail out early.
+    if api_usage == 0:
+        return None
 
-        matched_threshold = threshold
+    api_usage_percent = int(100 * api_usage / allowed_api_calls)
 
     # Didn't match even the lowest threshold, so no notification.
-    if matched_threshold is None:
-        return
+    if api_usage_percent < _SORTED_API_USAGE_ALERT_THRESHOLDS[0]:
+        return None
+
+    # Find the highest threshold that the usage has reached.
+    threshold_index = bisect_right(
+        _SORTED_API_USAGE_ALERT_THRESHOLDS, api_usage_percent
+    )
+    matched_threshold = _SORTED_API_USAGE_ALERT_THRESHOLDS[threshold_index - 1]
 
-    if OrganisationAPIUsageNotification.objects.filter(
-        notified_at__gt=period_starts_at,
-        percent_usage__gte=matched_threshold,
-    ).exists():
+    if any(
+        notified_at > period_starts_at and percent_usage >= matched_threshold
+        for notified_at, percent_usage in previous_notifications
+    ):
         # Already sent the max notification level so don't resend.
-        return
+        return None
 
-    send_api_usage_notification(organisation, matched_threshold)
+    return matched_threshold
+
+
+def _send_api_usage_notifications(
+    matched_thresholds: dict[int, int], notified_at: datetime
+) -> None:
+    """
+    Save the API usage notifications for the matched thresholds
+    of each organisation, then queue the emails to send them.
+
+    The emails are only queued once the notifications are saved,
+    so they aren't resent by the next run if saving them fails.
+    """
+    OrganisationAPIUsageNotification.objects.bulk_create(
+        [
+            OrganisationAPIUsageNotification(
+                organisation_id=organisation_id,
+                percent_usage=matched_threshold,
+                notified_at=notified_at,
+            )
+            for organisation_id, matched_threshold in matched_thresholds.items()
+        ]
+    )
+
+    # Only load the recipients of the organisations being notified.
+    recipients = _get_api_usage_notification_recipients(matched_thresholds)
+
+    for organisation_id, matched_threshold in matched_thresholds.items():
+        send_api_usage_notification_email.delay(
+            kwargs={
+                "organisation_id": organisation_id,
+                "matched_threshold": matched_threshold,
+                "recipient_list": recipients[organisation_id],
+            }
+        )
 
 
 def handle_api_usage_notifications() -> None:
-    flagsmith_client = get_client("local", local_eval=True)
+    now = timezone.now()
+    flagsmith_client = _get_local_flagsmith_client()
 
-    for organisation in Organisation.objects.all().select_related(
-        "subscription", "subscription_information_cache"
+    # Only keep the API usage period of each alerting organisation
+    # while streaming them, rather than the organisations themselves.
+    api_usage_periods = {}
+    organisation_ids_by_days = defaultdict(list)
+    for organisation in (
+        Organisation.objects.all()
+        .select_related("subscription", "subscription_information_cache")
+        .only(
+            "id",
+            "subscription__plan",
+            "subscription__max_api_calls",
+            "subscription_information_cache__current_billing_term_starts_at",
+            "subscription_information_cache__allowed_30d_api_calls",
+        )
+        .iterator(chunk_size=500)
     ):
-        feature_enabled = flagsmith_client.get_identity_flags(
-            organisation.flagsmith_identifier,
-            traits={
-                "organisation_id": organisation.id,
-                "subscription.plan": organisation.subscription.plan,
-            },
-        ).is_feature_enabled("api_usage_alerting")
-        if not feature_enabled:
+        flags = _get_organisation_flags(flagsmith_client, organisation)
+        if not flags.is_feature_enabled("api_usage_alerting"):
             continue
 
-        try:
-            _handle_api_usage_notifications(organisation)
-        except RuntimeError:
-            logger.error(
-                f"Error processing api usage for organisation {organisation.id}",
-                exc_info=True,
-            )
+        api_usage_period = _get_api_usage_period(organisation, now)
+        if api_usage_period is None:
+            continue
+
+        api_usage_periods[organisation.id] = api_usage_period
+        organisation_ids_by_days[api_usage_period[1]].append(organisation.id)
+
+    # Query the API usage once for each distinct period length
+    # rather than once for every organisation.
+    api_usage = {}
+    for days, organisation_ids in organisation_ids_by_days.items():
+        api_usage.update(get_current_api_usage_bulk(organisation_ids, f"-{days}d"))
+
+    # Load any notifications that could fall in a current
+    # period, which is at most a month ago for paid and free plans.
+    notifications = OrganisationAPIUsageNotification.objects.filter(
+        organisation_id__in=list(api_usage_periods),
+        notified_at__gt=now - timedelta(days=31),
+    ).values_list("organisation_id", "notified_at", "percent_usage")
+
+    previous_notifications = defaultdict(list)
+    for organisation_id, notified_at, percent_usage in notifications:
+        previous_notifications[organisation_id].append((notified_at, percent_usage))
+
+    matched_thresholds = {}
+    for organisation_id, api_usage_period in api_usage_periods.items():
+        period_starts_at, _, allowed_api_calls = api_usage_period
+        matched_threshold = _get_matched_threshold(
+            period_starts_at,
+            allowed_api_calls,
+            api_usage.get(organisation_id, 0),
+            previous_notifications[organisation_id],
+        )
+        if matched_threshold is not None:
+            matched_thresholds[organisation_id] = matched_threshold
+
+    _send_api_usage_notifications(matched_thresholds, now)
 
 
 def charge_for_api_call_count_overages():
@@ -246,18 +397,16 @@ def charge_for_api_call_count_overages():
     # being charged due to being at the end of the billing term.
     closing_billing_term = now + timedelta(hours=1)
 
-    organisation_ids = set(
-        OrganisationAPIUsageNotification.objects.filter(
-            notified_at__gte=api_usage_notified_at,
-            percent_usage__gte=100,
-        ).values_list("organisation_id", flat=True)
-    )
+    notified_organisation_ids = OrganisationAPIUsageNotification.objects.filter(
+        notified_at__gte=api_usage_notified_at,
+        percent_usage__gte=100,
+    ).values("organisation_id")
 
-    flagsmith_client = get_client("local", local_eval=True)
+    flagsmith_client = _get_local_flagsmith_client()
 
-    for organisation in (
+    organisations = list(
         Organisation.objects.filter(
-            id__in=organisation_ids,
+            id__in=notified_organisation_ids,
             subscription_information_cache__current_billing_term_ends_at__lte=closing_billing_term,
             subscription_information_cache__current_billing_term_ends_at__gte=now,
             subscription_information_cache__current_billing_term_starts_at__lte=F(
@@ -276,29 +425,47 @@ def charge_for_api_call_count_overages():
             "subscription_information_cache",
             "subscription",
         )
-    ):
-        flags = flagsmith_client.get_identity_flags(
-            organisation.flagsmith_identifier,
-            traits={
-                "organisation_id": organisation.id,
-                "subscription.plan": organisation.subscription.plan,
-            },
+        .only(
+            "id",
+            "name",
+            "subscription__plan",
+            "subscription__subscription_id",
+            "subscription_information_cache__allowed_30d_api_calls",
+        )
+    )
+
+    billable_organisation_ids = [organisation.id for organisation in organisations]
+    api_usage_by_organisation = get_current_api_usage_bulk(
+        billable_organisation_ids, "30d"
+    )
+
+    # Total up what has already been billed in each current billing term.
+    previous_api_overages = dict(
+        OrganisationAPIBilling.objects.filter(
+            organisation_id__in=billable_organisation_ids,
+            billed_at__gte=F(
+                "organisation__subscription_information_cache__current_billing_term_starts_at"
+            ),
         )
+        .values("organisation_id")
+        .annotate(total=Sum("api_overage"))
+        .values_list("organisation_id", "total")
+    )
+
+    for organisation in organisations:
+        flags = _get_organisation_flags(flagsmith_client, organisation)
         if not flags.is_feature_enabled("api_usage_overage_charges"):
             continue
 
         subscription_cache = organisation.subscription_information_cache
-        api_usage = get_current_api_usage(organisation.id, "30d")
+        api_usage = api_usage_by_organisation.get(organisation.id, 0)
 
         # Grace period for organisations < 200% of usage.
         if api_usage / subscription_cache.allowed_30d_api_calls < 2.0:
             logger.info("API Usage below normal usage or grace period.")
             continue
 
-        api_billings = OrganisationAPIBilling.objects.filter(
-            billed_at__gte=subscription_cache.current_billing_term_starts_at
-        )
-        previous_api_overage = sum([ap.api_overage for ap in api_billings])
+        previous_api_overage = previous_api_overages.get(organisation.id, 0)
 
         api_limit = subscription_cache.allowed_30d_api_calls + previous_api_overage
         api_overage = api_usage - api_limit
@@ -342,44 +509,29 @@ def restrict_use_due_to_api_limit_grace_period_over() -> None:
 
     grace_period = timezone.now() - timedelta(days=API_USAGE_GRACE_PERIOD)
     month_start = timezone.now() - timedelta(30)
-    queryset = (
-        OrganisationAPIUsageNotification.objects.filter(
-            notified_at__gt=month_start,
-            notified_at__lt=grace_period,
-            percent_usage__gte=100,
-        )
-        .values("organisation")
-        .annotate(max_value=Max("percent_usage"))
-    )
-
-    organisation_ids = []
-    for result in queryset:
-        organisation_ids.append(result["organisation"])
     organisations = (
         Organisation.objects.filter(
-            id__in=organisation_ids,
+            api_usage_notifications__notified_at__gt=month_start,
+            api_usage_notifications__notified_at__lt=grace_period,
+            api_usage_notifications__percent_usage__gte=100,
             subscription__plan=FREE_PLAN_ID,
             api_limit_access_block__isnull=True,
         )
         .select_related("subscription")
+        .only("id", "name", "subscription__plan")
         .exclude(
             stop_serving_flags=True,
             block_access_to_admin=True,
         )
+        .distinct()
     )
 
-    update_organisations = []
+    organisation_ids_by_restriction = defaultdict(list)
     api_limit_access_blocks = []
-    flagsmith_client = get_client("local", local_eval=True)
+    flagsmith_client = _get_local_flagsmith_client()
 
     for organisation in organisations:
-        flags = flagsmith_client.get_identity_flags(
-            organisation.flagsmith_identifier,
-            traits={
-                "organisation_id": organisation.id,
-                "subscription.plan": organisation.subscription.plan,
-            },
-        )
+        flags = _get_organisation_flags(flagsmith_client, organisation)
 
         stop_serving = flags.is_feature_enabled("api_limiting_stop_serving_flags")
         block_access = flags.is_feature_enabled("api_limiting_block_access_to_admin")
@@ -387,17 +539,24 @@ def restrict_use_due_to_api_limit_grace_period_over() -> None:
         if not stop_serving and not block_access:
             continue
 
-        organisation.stop_serving_flags = stop_serving
-        organisation.block_access_to_admin = block_access
-
+        organisation_ids_by_restriction[(stop_serving, block_access)].append(
+            organisation.id
+        )
         api_limit_access_blocks.append(APILimitAccessBlock(organisation=organisation))
-        update_organisations.append(organisation)
 
-    APILimitAccessBlock.objects.bulk_create(api_limit_access_blocks)
+    # Apply the access blocks and restrictions together in one commit.
+    with transaction.atomic():
+        APILimitAccessBlock.objects.bulk_create(
+            api_limit_access_blocks, batch_size=500, ignore_conflicts=True
+        )
 
-    Organisation.objects.bulk_update(
-        update_organisations, ["stop_serving_flags", "block_access_to_admin"]
-    )
+        # Issue a single update per combination of restrictions.
+        for restriction, organisation_ids in organisation_ids_by_restriction.items():
+            stop_serving, block_access = restriction
+            Organisation.objects.filter(id__in=organisation_ids).update(
+                stop_serving_flags=stop_serving,
+                block_access_to_admin=block_access,
+            )
 
 
 def unrestrict_after_api_limit_grace_period_is_stale() -> None:
@@ -411,31 +570,20 @@ def unrestrict_after_api_limit_grace_period_is_stale() -> None:
     """
 
     month_start = timezone.now() - timedelta(30)
-    still_restricted_organisation_notifications = (
-        OrganisationAPIUsageNotification.objects.filter(
-            notified_at__gt=month_start,
-            percent_usage__gte=100,
-        )
-        .values("organisation")
-        .annotate(max_value=Max("percent_usage"))
-    )
-    still_restricted_organisation_ids = {
-        q["organisation"] for q in still_restricted_organisation_notifications
-    }
-    organisation_ids = set(
-        Organisation.objects.filter(
-            api_limit_access_block__isnull=False,
-        ).values_list("id", flat=True)
-    )
-
-    matching_organisations = Organisation.objects.filter(
-        id__in=(organisation_ids - still_restricted_organisation_ids),
-    )
-
-    matching_organisations.update(stop_serving_flags=False, block_access_to_admin=False)
-
-    for organisation in matching_organisations:
-        organisation.api_limit_access_block.delete()
+    still_restricted_organisation_ids = OrganisationAPIUsageNotification.objects.filter(
+        notified_at__gt=month_start,
+        percent_usage__gte=100,
+    ).values("organisation_id")
+
+    Organisation.objects.filter(
+        api_limit_access_block__isnull=False,
+    ).exclude(
+        id__in=still_restricted_organisation_ids,
+    ).update(stop_serving_flags=False, block_access_to_admin=False)
+
+    APILimitAccessBlock.objects.exclude(
+        organisation_id__in=still_restricted_organisation_ids,
+    ).delete()
 
 
 def register_recurring_tasks() -> None:
@@ -9,6 +9,7 @@ from _pytest.monkeypatch import MonkeyPatch
 from app_analytics.influxdb_wrapper import (
     InfluxDBWrapper,
     build_filter_string,
+    get_current_api_usage_bulk,
     get_event_list_for_organisation,
     get_events_for_organisation,
     get_feature_evaluation_data,
@@ -442,6 +443,93 @@ def test_get_top_organisations_value_error(
     assert dataset == {456: 43}
 
 
+def test_get_current_api_usage_bulk(mocker: MockerFixture) -> None:
+    # Given
+    record_mock1 = mock.MagicMock()
+    record_mock1.values = {"organisation_id": "123"}
+    record_mock1.get_value.return_value = 23
+
+    record_mock2 = mock.MagicMock()
+    record_mock2.values = {"organisation_id": "456"}
+    record_mock2.get_value.return_value = 43
+
+    result = mock.MagicMock()
+    result.records = [record_mock1, record_mock2]
+
+    influx_mock = mocker.patch(
+        "app_analytics.influxdb_wrapper.InfluxDBWrapper.influx_query_manager"
+    )
+
+    influx_mock.return_value = [result]
+
+    # When
+    dataset = get_current_api_usage_bulk([123, 456, 789], "-14d")
+
+    # Then
+    assert dataset == {123: 23, 456: 43}
+
+    influx_mock.assert_called_once()
+    influx_query_call = influx_mock.call_args
+    assert influx_query_call.kwargs["date_start"] == "-14d"
+    assert (
+        'contains(value: r["organisation_id"], set: ["123", "456", "789"])'
+        in influx_query_call.kwargs["filters"]
+    )
+
+
+def test_get_current_api_usage_bulk_without_organisations(
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    influx_mock = mocker.patch(
+        "app_analytics.influxdb_wrapper.InfluxDBWrapper.influx_query_manager"
+    )
+
+    # When
+    dataset = get_current_api_usage_bulk([], "-30d")
+
+    # Then
+    assert dataset == {}
+    influx_mock.assert_not_called()
+
+
+def test_get_current_api_usage_bulk_queries_in_chunks(
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    mocker.patch(
+        "app_analytics.influxdb_wrapper.API_USAGE_BULK_QUERY_CHUNK_SIZE",
+        2,
+    )
+
+    def make_result(organisation_id: str, value: int) -> MagicMock:
+        record_mock = mock.MagicMock()
+        record_mock.values = {"organisation_id": organisation_id}
+        record_mock.get_value.return_value = value
+        result = mock.MagicMock()
+        result.records = [record_mock]
+        return result
+
+    influx_mock = mocker.patch(
+        "app_analytics.influxdb_wrapper.InfluxDBWrapper.influx_query_manager"
+    )
+    influx_mock.side_effect = [
+        [make_result("1", 10), make_result("2", 20)],
+        [make_result("3", 30)],
+    ]
+
+    # When
+    dataset = get_current_api_usage_bulk([1, 2, 3], "-30d")
+
+    # Then
+    assert dataset == {1: 10, 2: 20, 3: 30}
+
+    assert influx_mock.call_count == 2
+    first_call, second_call = influx_mock.call_args_list
+    assert 'set: ["1", "2"])' in first_call.kwargs["filters"]
+    assert 'set: ["3"])' in second_call.kwargs["filters"]
+
+
 def test_early_return_for_empty_range_for_influx_query_manager() -> None:
     # When
     results = InfluxDBWrapper.influx_query_manager(
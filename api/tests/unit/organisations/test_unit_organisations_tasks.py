@@ -1,10 +1,11 @@
 import logging
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, call
 
 import pytest
 from django.core.mail.message import EmailMultiAlternatives
+from django.db import DatabaseError
 from django.utils import timezone
 from freezegun.api import FrozenDateTimeFactory
 from pytest_django.fixtures import SettingsWrapper
@@ -258,7 +259,7 @@ def test_handle_api_usage_notifications_when_feature_flag_is_off(
         current_billing_term_ends_at=now + timedelta(days=320),
     )
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
     get_client_mock = mocker.patch("organisations.tasks.get_client")
     client_mock = MagicMock()
@@ -309,9 +310,9 @@ def test_handle_api_usage_notifications_below_100(
         current_billing_term_ends_at=now + timedelta(days=320),
     )
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 91
+    mock_api_usage.return_value = {organisation.id: 91}
     get_client_mock = mocker.patch("organisations.tasks.get_client")
     client_mock = MagicMock()
     get_client_mock.return_value = client_mock
@@ -325,7 +326,7 @@ def test_handle_api_usage_notifications_below_100(
     handle_api_usage_notifications()
 
     # Then
-    mock_api_usage.assert_called_once_with(organisation.id, "-14d")
+    mock_api_usage.assert_called_once_with([organisation.id], "-14d")
 
     assert len(mailoutbox) == 1
     email = mailoutbox[0]
@@ -408,9 +409,9 @@ def test_handle_api_usage_notifications_above_100(
         current_billing_term_ends_at=now + timedelta(days=320),
     )
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 105
+    mock_api_usage.return_value = {organisation.id: 105}
 
     get_client_mock = mocker.patch("organisations.tasks.get_client")
     client_mock = MagicMock()
@@ -425,7 +426,7 @@ def test_handle_api_usage_notifications_above_100(
     handle_api_usage_notifications()
 
     # Then
-    mock_api_usage.assert_called_once_with(organisation.id, "-14d")
+    mock_api_usage.assert_called_once_with([organisation.id], "-14d")
 
     assert len(mailoutbox) == 1
     email = mailoutbox[0]
@@ -495,9 +496,9 @@ def test_handle_api_usage_notifications_for_free_accounts(
     assert organisation.subscription.max_api_calls == MAX_API_CALLS_IN_FREE_PLAN
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = MAX_API_CALLS_IN_FREE_PLAN + 5_000
+    mock_api_usage.return_value = {organisation.id: MAX_API_CALLS_IN_FREE_PLAN + 5_000}
 
     get_client_mock = mocker.patch("organisations.tasks.get_client")
     client_mock = MagicMock()
@@ -512,7 +513,7 @@ def test_handle_api_usage_notifications_for_free_accounts(
     handle_api_usage_notifications()
 
     # Then
-    mock_api_usage.assert_called_once_with(organisation.id, "-30d")
+    mock_api_usage.assert_called_once_with([organisation.id], "-30d")
 
     assert len(mailoutbox) == 1
     email = mailoutbox[0]
@@ -575,6 +576,89 @@ def test_handle_api_usage_notifications_for_free_accounts(
     assert OrganisationAPIUsageNotification.objects.first() == api_usage_notification
 
 
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_handle_api_usage_notifications_ignores_other_organisations_notifications(
+    mocker: MockerFixture,
+    organisation: Organisation,
+    mailoutbox: list[EmailMultiAlternatives],
+) -> None:
+    # Given
+    organisation2 = Organisation.objects.create(name="Org #2")
+    UserOrganisation.objects.create(
+        organisation=organisation2,
+        user=FFAdminUser.objects.create(email="admin2@example.com"),
+        role=OrganisationRole.ADMIN,
+    )
+
+    # The notification for the first organisation shouldn't
+    # prevent the second organisation from being notified.
+    OrganisationAPIUsageNotification.objects.create(
+        organisation=organisation,
+        percent_usage=100,
+        notified_at=timezone.now(),
+    )
+
+    mocker.patch(
+        "organisations.tasks.get_current_api_usage_bulk",
+        return_value={
+            organisation.id: MAX_API_CALLS_IN_FREE_PLAN + 5_000,
+            organisation2.id: MAX_API_CALLS_IN_FREE_PLAN + 5_000,
+        },
+    )
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
+
+    # When
+    handle_api_usage_notifications()
+
+    # Then
+    assert len(mailoutbox) == 1
+    assert mailoutbox[0].to == ["admin2@example.com"]
+    assert (
+        OrganisationAPIUsageNotification.objects.filter(
+            organisation=organisation,
+        ).count()
+        == 1
+    )
+    assert (
+        OrganisationAPIUsageNotification.objects.filter(
+            organisation=organisation2,
+        ).count()
+        == 1
+    )
+
+
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_handle_api_usage_notifications_without_api_usage(
+    mocker: MockerFixture,
+    organisation: Organisation,
+    mailoutbox: list[EmailMultiAlternatives],
+) -> None:
+    # Given
+    mock_api_usage = mocker.patch(
+        "organisations.tasks.get_current_api_usage_bulk",
+    )
+    mock_api_usage.return_value = {}
+
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
+
+    # When
+    handle_api_usage_notifications()
+
+    # Then
+    mock_api_usage.assert_called_once_with([organisation.id], "-30d")
+
+    assert len(mailoutbox) == 0
+    assert not OrganisationAPIUsageNotification.objects.filter(
+        organisation=organisation,
+    ).exists()
+
+
 def test_handle_api_usage_notifications_missing_info_cache(
     mocker: MockerFixture,
     organisation: Organisation,
@@ -592,7 +676,7 @@ def test_handle_api_usage_notifications_missing_info_cache(
     assert organisation.has_subscription_information_cache() is False
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
 
     get_client_mock = mocker.patch("organisations.tasks.get_client")
@@ -620,6 +704,205 @@ def test_handle_api_usage_notifications_missing_info_cache(
     ]
 
 
+@pytest.mark.parametrize(
+    "now, current_billing_term_starts_at, period_starts_at, expected_days",
+    [
+        # Billing term started more than a year ago.
+        (
+            "2023-01-19T09:09:47+00:00",
+            "2021-11-05T00:00:00+00:00",
+            "2023-01-05T00:00:00+00:00",
+            14,
+        ),
+        # Billing day of the current month hasn't been reached yet.
+        (
+            "2023-01-19T09:09:47+00:00",
+            "2022-10-25T00:00:00+00:00",
+            "2022-12-25T00:00:00+00:00",
+            25,
+        ),
+        # Billing term started on the 31st of a month.
+        (
+            "2023-01-19T09:09:47+00:00",
+            "2022-10-31T00:00:00+00:00",
+            "2022-12-31T00:00:00+00:00",
+            19,
+        ),
+        # Billing term started on the 31st, truncated to a shorter month.
+        (
+            "2023-03-15T09:09:47+00:00",
+            "2022-08-31T00:00:00+00:00",
+            "2023-02-28T00:00:00+00:00",
+            15,
+        ),
+    ],
+)
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_handle_api_usage_notifications_uses_current_billing_period(
+    mocker: MockerFixture,
+    organisation: Organisation,
+    mailoutbox: list[EmailMultiAlternatives],
+    freezer: FrozenDateTimeFactory,
+    now: str,
+    current_billing_term_starts_at: str,
+    period_starts_at: str,
+    expected_days: int,
+) -> None:
+    # Given
+    freezer.move_to(now)
+    period_starts_at = datetime.fromisoformat(period_starts_at)
+
+    organisation.subscription.plan = SCALE_UP
+    organisation.subscription.subscription_id = "fancy_id"
+    organisation.subscription.save()
+    OrganisationSubscriptionInformationCache.objects.create(
+        organisation=organisation,
+        allowed_seats=10,
+        allowed_projects=3,
+        allowed_30d_api_calls=100,
+        chargebee_email="test@example.com",
+        current_billing_term_starts_at=datetime.fromisoformat(
+            current_billing_term_starts_at
+        ),
+        current_billing_term_ends_at=timezone.now() + timedelta(days=30),
+    )
+
+    # Notified just before the current period started, so
+    # it shouldn't prevent a notification for this period.
+    OrganisationAPIUsageNotification.objects.create(
+        organisation=organisation,
+        percent_usage=90,
+        notified_at=period_starts_at - timedelta(minutes=1),
+    )
+
+    mock_api_usage = mocker.patch(
+        "organisations.tasks.get_current_api_usage_bulk",
+    )
+    mock_api_usage.return_value = {organisation.id: 91}
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
+
+    # When
+    handle_api_usage_notifications()
+
+    # Then
+    mock_api_usage.assert_called_once_with([organisation.id], f"-{expected_days}d")
+
+    assert len(mailoutbox) == 1
+    assert mailoutbox[0].subject == "Flagsmith API use has reached 90%"
+    assert (
+        OrganisationAPIUsageNotification.objects.filter(
+            organisation=organisation,
+            notified_at__gt=period_starts_at,
+        ).count()
+        == 1
+    )
+
+    # Now re-run the usage to make sure the notification within
+    # the current period prevents it from being resent.
+    handle_api_usage_notifications()
+
+    assert len(mailoutbox) == 1
+    assert (
+        OrganisationAPIUsageNotification.objects.filter(
+            organisation=organisation,
+        ).count()
+        == 2
+    )
+
+
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_handle_api_usage_notifications_does_not_send_email_if_saving_fails(
+    mocker: MockerFixture,
+    organisation: Organisation,
+    mailoutbox: list[EmailMultiAlternatives],
+) -> None:
+    # Given
+    mocker.patch(
+        "organisations.tasks.get_current_api_usage_bulk",
+        return_value={organisation.id: MAX_API_CALLS_IN_FREE_PLAN + 5_000},
+    )
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
+
+    mocker.patch.object(
+        OrganisationAPIUsageNotification.objects,
+        "bulk_create",
+        side_effect=DatabaseError,
+    )
+
+    # When
+    with pytest.raises(DatabaseError):
+        handle_api_usage_notifications()
+
+    # Then
+    assert len(mailoutbox) == 0
+
+
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_handle_api_usage_notifications_recipients_depend_on_threshold(
+    mocker: MockerFixture,
+    organisation: Organisation,
+    mailoutbox: list[EmailMultiAlternatives],
+) -> None:
+    # Given
+    organisation2 = Organisation.objects.create(name="Org #2")
+    UserOrganisation.objects.create(
+        organisation=organisation2,
+        user=FFAdminUser.objects.create(email="admin2@example.com"),
+        role=OrganisationRole.ADMIN,
+    )
+    UserOrganisation.objects.create(
+        organisation=organisation2,
+        user=FFAdminUser.objects.create(email="staff2@example.com"),
+        role=OrganisationRole.USER,
+    )
+
+    mocker.patch(
+        "organisations.tasks.get_current_api_usage_bulk",
+        return_value={
+            organisation.id: MAX_API_CALLS_IN_FREE_PLAN * 91 // 100,
+            organisation2.id: MAX_API_CALLS_IN_FREE_PLAN,
+        },
+    )
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
+
+    # When
+    handle_api_usage_notifications()
+
+    # Then
+    recipients_by_subject = {email.subject: email.to for email in mailoutbox}
+    assert recipients_by_subject == {
+        # Only admins because the threshold is under 100.
+        "Flagsmith API use has reached 90%": ["admin@example.com"],
+        # Every user once the threshold reaches 100.
+        "Flagsmith API use has reached 100%": [
+            "admin2@example.com",
+            "staff2@example.com",
+        ],
+    }
+
+    assert (
+        OrganisationAPIUsageNotification.objects.get(
+            organisation=organisation
+        ).percent_usage
+        == 90
+    )
+    assert (
+        OrganisationAPIUsageNotification.objects.get(
+            organisation=organisation2
+        ).percent_usage
+        == 100
+    )
+
+
 @pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
 def test_charge_for_api_call_count_overages_scale_up(
     organisation: Organisation,
@@ -656,9 +939,9 @@ def test_charge_for_api_call_count_overages_scale_up(
     client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 212_005
+    mock_api_usage.return_value = {organisation.id: 212_005}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -723,9 +1006,9 @@ def test_charge_for_api_call_count_overages_scale_up_when_flagsmith_client_sets_
     client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = False
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 212_005
+    mock_api_usage.return_value = {organisation.id: 212_005}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -778,10 +1061,10 @@ def test_charge_for_api_call_count_overages_grace_period(
         "organisations.chargebee.chargebee.chargebee.Subscription.update"
     )
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
     # Set the return value to something less than 200% of base rate
-    mock_api_usage.return_value = 115_000
+    mock_api_usage.return_value = {organisation.id: 115_000}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -831,9 +1114,9 @@ def test_charge_for_api_call_count_overages_with_not_covered_plan(
     )
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 12_005
+    mock_api_usage.return_value = {organisation.id: 12_005}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -880,9 +1163,9 @@ def test_charge_for_api_call_count_overages_under_api_limit(
     )
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 2_000
+    mock_api_usage.return_value = {organisation.id: 2_000}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -928,9 +1211,9 @@ def test_charge_for_api_call_count_overages_start_up(
     )
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 202_005
+    mock_api_usage.return_value = {organisation.id: 202_005}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -1009,9 +1292,9 @@ def test_charge_for_api_call_count_overages_start_up_with_api_billing(
     )
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
-    mock_api_usage.return_value = 202_005
+    mock_api_usage.return_value = {organisation.id: 202_005}
     assert OrganisationAPIBilling.objects.count() == 1
 
     # When
@@ -1035,6 +1318,78 @@ def test_charge_for_api_call_count_overages_start_up_with_api_billing(
     assert OrganisationAPIBilling.objects.count() == 2
 
 
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_charge_for_api_call_count_overages_ignores_other_organisations_api_billing(
+    organisation: Organisation,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    now = timezone.now()
+    OrganisationSubscriptionInformationCache.objects.create(
+        organisation=organisation,
+        allowed_seats=10,
+        allowed_projects=3,
+        allowed_30d_api_calls=100_000,
+        chargebee_email="test@example.com",
+        current_billing_term_starts_at=now - timedelta(days=30),
+        current_billing_term_ends_at=now + timedelta(minutes=30),
+    )
+    organisation.subscription.subscription_id = "fancy_sub_id23"
+    organisation.subscription.plan = "startup-v2"
+    organisation.subscription.save()
+    OrganisationAPIUsageNotification.objects.create(
+        organisation=organisation,
+        percent_usage=100,
+        notified_at=now,
+    )
+
+    # Billing for another organisation within the same billing term
+    # shouldn't count towards this organisation's previous overage.
+    other_organisation = Organisation.objects.create(name="Other Org")
+    OrganisationAPIBilling.objects.create(
+        organisation=other_organisation,
+        api_overage=100_000,
+        immediate_invoice=False,
+        billed_at=now,
+    )
+
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.return_value.is_feature_enabled.return_value = True
+    mocker.patch("organisations.chargebee.chargebee.chargebee.Subscription.retrieve")
+    mock_chargebee_update = mocker.patch(
+        "organisations.chargebee.chargebee.chargebee.Subscription.update"
+    )
+
+    mock_api_usage = mocker.patch(
+        "organisations.tasks.get_current_api_usage_bulk",
+    )
+    mock_api_usage.return_value = {organisation.id: 202_005}
+
+    # When
+    charge_for_api_call_count_overages()
+
+    # Then
+    mock_chargebee_update.assert_called_once_with(
+        organisation.subscription.subscription_id,
+        {
+            "addons": [
+                {
+                    "id": "additional-api-start-up-monthly",
+                    "quantity": 2,  # 200k API requests.
+                }
+            ],
+            "prorate": False,
+            "invoice_immediately": False,
+        },
+    )
+
+    assert OrganisationAPIBilling.objects.filter(organisation=organisation).count() == 1
+    api_billing = OrganisationAPIBilling.objects.get(organisation=organisation)
+    assert api_billing.api_overage == 200_000
+
+
 @pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
 def test_charge_for_api_call_count_overages_with_yearly_account(
     organisation: Organisation,
@@ -1066,10 +1421,10 @@ def test_charge_for_api_call_count_overages_with_yearly_account(
     )
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
 
-    mock_api_usage.return_value = 12_005
+    mock_api_usage.return_value = {organisation.id: 12_005}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -1111,10 +1466,10 @@ def test_charge_for_api_call_count_overages_with_bad_plan(
     )
 
     mock_api_usage = mocker.patch(
-        "organisations.tasks.get_current_api_usage",
+        "organisations.tasks.get_current_api_usage_bulk",
     )
 
-    mock_api_usage.return_value = 12_005
+    mock_api_usage.return_value = {organisation.id: 12_005}
     assert OrganisationAPIBilling.objects.count() == 0
 
     # When
@@ -1248,6 +1603,68 @@ def test_restrict_use_due_to_api_limit_grace_period_over(
     assert getattr(organisation, "api_limit_access_block", None) is None
 
 
+@pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
+def test_restrict_use_due_to_api_limit_grace_period_over_with_partial_restrictions(
+    mocker: MockerFixture,
+    organisation: Organisation,
+    freezer: FrozenDateTimeFactory,
+) -> None:
+    # Given
+    organisation2 = Organisation.objects.create(name="Org #2")
+    organisation3 = Organisation.objects.create(name="Org #3")
+
+    enabled_features = {
+        organisation.flagsmith_identifier: {"api_limiting_stop_serving_flags"},
+        organisation2.flagsmith_identifier: {"api_limiting_block_access_to_admin"},
+        organisation3.flagsmith_identifier: set(),
+    }
+
+    def get_identity_flags(identifier: str, traits: dict) -> MagicMock:
+        flags = MagicMock()
+        flags.is_feature_enabled.side_effect = (
+            lambda feature_name: feature_name in enabled_features[identifier]
+        )
+        return flags
+
+    get_client_mock = mocker.patch("organisations.tasks.get_client")
+    client_mock = MagicMock()
+    get_client_mock.return_value = client_mock
+    client_mock.get_identity_flags.side_effect = get_identity_flags
+
+    now = timezone.now()
+    for org in (organisation, organisation2, organisation3):
+        OrganisationAPIUsageNotification.objects.create(
+            notified_at=now,
+            organisation=org,
+            percent_usage=100,
+        )
+
+    freezer.move_to(now + timedelta(days=API_USAGE_GRACE_PERIOD + 1))
+
+    # When
+    restrict_use_due_to_api_limit_grace_period_over()
+
+    # Then
+    organisation.refresh_from_db()
+    organisation2.refresh_from_db()
+    organisation3.refresh_from_db()
+
+    # Only serving flags are stopped.
+    assert organisation.stop_serving_flags is True
+    assert organisation.block_access_to_admin is False
+    assert organisation.api_limit_access_block
+
+    # Only access to the admin is blocked.
+    assert organisation2.stop_serving_flags is False
+    assert organisation2.block_access_to_admin is True
+    assert organisation2.api_limit_access_block
+
+    # Neither restriction is enabled, so the organisation is untouched.
+    assert organisation3.stop_serving_flags is False
+    assert organisation3.block_access_to_admin is False
+    assert getattr(organisation3, "api_limit_access_block", None) is None
+
+
 @pytest.mark.freeze_time("2023-01-19T09:09:47.325132+00:00")
 def test_unrestrict_after_api_limit_grace_period_is_stale(
     organisation: Organisation,